@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, jsonify, request, stream_with_context
 import vertexai
 from vertexai.generative_models import (
     FunctionDeclaration,
@@ -8,8 +8,12 @@ from vertexai.generative_models import (
     Tool,
 )
 import utils
+from config import COMMAND_WHITELIST
+import asyncio
+import json
 import os
-import yaml
+import re
+import threading
 from dotenv import load_dotenv
 
 # --- Load Environment Variables and Configuration ---
@@ -24,40 +28,36 @@ MODEL_NAME = "gemini-2.0-flash-exp"
 vertexai.init(project=PROJECT_ID, location=LOCATION)
 
 # --- Function Declaration for Linux Command Execution ---
-# Load command whitelist from commands.yaml
-with open("commands.yaml", "r") as f:
-    COMMAND_WHITELIST = yaml.safe_load(f)
-
-# Create a function declaration for each command in the whitelist
-function_declarations = []
-for intent, details in COMMAND_WHITELIST["commands"].items():
-    # Determine the description based on whether it's a function or command
-    if "function" in details:
-        description = details.get("description", f"Performs the action: {intent}")
-    else:
-        description = details.get(
-            "description", f"Executes the Linux command: {details['command']}"
-        )
-
-    function_declarations.append(
-        FunctionDeclaration(
-            name=intent,
-            description=description,
-            parameters={
-                "type": "object",
-                "properties": {
-                    param_data["name"]: {
-                        "type": "string",
-                        "description": param_data["name"],
-                    }
-                    for param_data in details.get("parameters", [])
+def _build_declarations(commands):
+    """Creates a function declaration for each command in the whitelist."""
+    function_declarations = []
+    for intent, details in commands["commands"].items():
+        # Determine the description based on whether it's a function or command
+        if "function" in details:
+            description = details.get("description", f"Performs the action: {intent}")
+        else:
+            description = details.get(
+                "description", f"Executes the Linux command: {details['command']}"
+            )
+
+        param_names = [param_data["name"] for param_data in details.get("parameters", [])]
+        function_declarations.append(
+            FunctionDeclaration(
+                name=intent,
+                description=description,
+                parameters={
+                    "type": "object",
+                    "properties": {
+                        name: {"type": "string", "description": name}
+                        for name in param_names
+                    },
+                    "required": param_names,
                 },
-                "required": [
-                    param_data["name"] for param_data in details.get("parameters", [])
-                ],
-            },
+            )
         )
-    )
+    return function_declarations
+
+function_declarations = _build_declarations(COMMAND_WHITELIST)
 
 # Create the Tool object
 linux_command_tool = Tool(function_declarations=function_declarations)
@@ -74,128 +74,144 @@ model = GenerativeModel(
 # --- Chat Session ---
 chat = model.start_chat()
 
-# --- API Endpoint ---
-@app.route("/chat", methods=["POST"])
-def chat_endpoint():
-    try:
-        data = request.get_json()
-        user_input = data.get("message", "")
+# --- User Input Parsing ---
+# Matches "analyze the codebase <path> [for <issue>]" and "analyze the file <path> [for <issue>]"
+_ANALYZE_RE = re.compile(
+    r"^\s*analyze the (?P<kind>codebase|file)\s+(?P<path>\S+)(?:\s+for\s+(?P<issue>.+?))?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
 
-        # Initialize text_parts here
-        text_parts = []
+# --- Event Loop ---
+# All Gemini calls run on one shared event loop so concurrent requests
+# overlap their network round-trips instead of each pinning a thread.
+_LOOP = asyncio.new_event_loop()
+threading.Thread(target=_LOOP.run_forever, daemon=True).start()
 
+def _iterate_async(agen):
+    """Drives an async generator on the shared loop from a sync (WSGI) generator."""
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(agen.__anext__(), _LOOP).result()
+            except StopAsyncIteration:
+                break
+    finally:
+        asyncio.run_coroutine_threadsafe(agen.aclose(), _LOOP).result()
+
+# --- Streaming Helpers ---
+# Maximum number of function call rounds the model may chain for one message
+MAX_TOOL_ROUNDS = 3
+
+def _sse(payload):
+    """Formats a payload as a server-sent event."""
+    return f"data: {json.dumps(payload)}\n\n"
+
+async def _run_function(function_name, function_args):
+    """Calls the function from utils.py that matches the model's function call."""
+    if function_name == "analyze_codebase":
+        return await asyncio.to_thread(utils.analyze_codebase, function_args, model=chat)
+    return await asyncio.to_thread(utils.execute_command, function_name, function_args)
+
+async def _stream_file_output(function_args, blocks):
+    """Streams read_file output to the client as it is read, collecting it in blocks for the model."""
+    yield _sse({"text": "Command output: "})
+    file_blocks = utils.iter_read_file(function_args)
+    while (block := await asyncio.to_thread(next, file_blocks, None)) is not None:
+        blocks.append(block)
+        yield _sse({"text": block})
+    yield _sse({"text": "\n"})
+
+async def _stream_function_call(function_name, function_args, tool_round=1):
+    """Runs a function call, echoes its output to the client and streams the model's follow-up."""
+    if function_name == "read_file":
+        # Stream the file to the client as it is read, collecting it for the model
+        blocks = []
+        async for event in _stream_file_output(function_args, blocks):
+            yield event
+        command_output = "".join(blocks)
+    else:
+        command_output = await _run_function(function_name, function_args)
+        yield _sse({"text": f"Command output: {command_output}\n"})
+
+    # Send function response back to model
+    function_response = Part.from_function_response(
+        name=function_name,
+        response={"content": command_output}
+    )
+    response_stream = await chat.send_message_async(function_response, stream=True)
+    async for event in _stream_reply(response_stream, tool_round=tool_round):
+        yield event
+
+async def _stream_reply(response_stream, tool_round=0):
+    """Yields text chunks as they arrive, buffering function calls until the stream ends.
+
+    tool_round is the number of function call rounds already run for this message.
+    """
+    function_calls = []
+    async for chunk in response_stream:
+        if not chunk.candidates or not chunk.candidates[0].content:
+            continue
+        for part in chunk.candidates[0].content.parts:
+            if hasattr(part, 'text') and part.text:
+                yield _sse({"text": part.text})
+            elif hasattr(part, 'function_call') and part.function_call.name:
+                function_calls.append(part.function_call)
+
+    if function_calls and tool_round >= MAX_TOOL_ROUNDS:
+        # Stop a model that keeps calling functions from looping indefinitely
+        names = ", ".join(function_call.name for function_call in function_calls)
+        yield _sse({"error": f"Stopped after {MAX_TOOL_ROUNDS} function call rounds, not running: {names}"})
+        return
+
+    # The chat history is only complete once the stream is drained
+    for function_call in function_calls:
+        function_name = function_call.name
+        function_args = {k: v for k, v in function_call.args.items()}
+        async for event in _stream_function_call(function_name, function_args, tool_round=tool_round + 1):
+            yield event
+
+async def _chat_events(user_input):
+    """Produces the server-sent events for a single chat message."""
+    try:
         # Basic parsing
-        analyze_command = "analyze the codebase"
-        if analyze_command in user_input.lower():
-            # Handling for "analyze the codebase"
-            parts = user_input.lower().split(analyze_command)
-            if len(parts) > 1:
-                path_part = parts[1].strip()
-
-                if " for " in path_part:
-                    path, issue = path_part.split(" for ", 1)
-                    issue = issue.strip()
-                else:
-                    path = path_part
-                    issue = None
-
-                base_path = path.strip()
-                function_args = {"base_path": base_path, "issue": issue}
-                command_output = utils.analyze_codebase(function_args, model=chat)
-
-                # Send function response back to model
-                function_response = Part.from_function_response(
-                    name="analyze_codebase",
-                    response={"content": command_output}
-                )
-                followup_response = chat.send_message(function_response)
-
-                # Add function output to response
-                if followup_response.candidates:
-                    followup_text = followup_response.candidates[0].content.parts[0].text
-                    text_parts.append(f"Command output: {command_output}\n{followup_text}")
-
-        elif "analyze the file" in user_input.lower():
-            # Handling for "analyze the file"
-            parts = user_input.lower().split("analyze the file")
-            if len(parts) > 1:
-                path_part = parts[1].strip()
-
-                if " for " in path_part:
-                    path, issue = path_part.split(" for ", 1)
-                    issue = issue.strip()
-                else:
-                    path = path_part
-                    issue = None
-
-                filename = os.path.basename(path)
-                base_path = os.path.dirname(path)
-
-                function_args = {"base_path": base_path, "filename": filename, "issue": issue}
-                command_output = utils.analyze_codebase(function_args, model=chat)
-
-                # Send function response back to model
-                function_response = Part.from_function_response(
-                    name="analyze_codebase",
-                    response={"content": command_output}
-                )
-                followup_response = chat.send_message(function_response)
-
-                # Add function output to response
-                if followup_response.candidates:
-                    followup_text = followup_response.candidates[0].content.parts[0].text
-                    text_parts.append(f"Command output: {command_output}\n{followup_text}")
+        match = _ANALYZE_RE.match(user_input)
+        if match:
+            path, issue = match["path"], match["issue"]
+            if match["kind"].lower() == "codebase":
+                # Handling for "analyze the codebase"
+                function_args = {"base_path": path, "issue": issue}
+            else:
+                # Handling for "analyze the file"
+                function_args = {
+                    "base_path": os.path.dirname(path),
+                    "filename": os.path.basename(path),
+                    "issue": issue,
+                }
+            async for event in _stream_function_call("analyze_codebase", function_args):
+                yield event
 
         else:
             # Send Message to Gemini (non-analyze command)
-            response = chat.send_message(user_input)
-            print(f"Initial response: {response.candidates[0] if response.candidates else 'No candidates'}")
-
-            if not response.candidates:
-                return jsonify({"response": "No response from the model."})
-
-            candidate = response.candidates[0]
-            
-            # Handle different response types
-            if candidate.content and candidate.content.parts:
-                # Get all text parts and combine them
-                for part in candidate.content.parts:
-                    if hasattr(part, 'text') and part.text:
-                        text_parts.append(part.text)
-                    elif hasattr(part, 'function_call'):
-                        # Handle function call
-                        function_name = part.function_call.name
-                        function_args = {k: v for k, v in part.function_call.args.items()}
-                            
-                        # Call functions from utils.py, passing the model
-                        if function_name == "analyze_codebase":
-                            command_output = utils.analyze_codebase(function_args, model=chat)
-                        elif function_name == "read_file":
-                            command_output = utils.read_file(function_args)
-                        else:
-                            command_output = utils.execute_command(function_name, function_args)
-                            
-                        # Send function response back to model
-                        function_response = Part.from_function_response(
-                            name=function_name,
-                            response={"content": command_output}
-                        )
-                        followup_response = chat.send_message(function_response)
-
-                        # Add function output to response
-                        if followup_response.candidates:
-                            followup_text = followup_response.candidates[0].content.parts[0].text
-                            text_parts.append(f"Command output: {command_output}\n{followup_text}")
-
-        # Combine all responses
-        if text_parts:
-            return jsonify({"response": "\n".join(text_parts)})
-
-        return jsonify({"response": "No clear response from the model."})
+            response_stream = await chat.send_message_async(user_input, stream=True)
+            async for event in _stream_reply(response_stream):
+                yield event
+
+        yield _sse({"done": True})
 
     except Exception as e:
         print(f"Error: {e}")
-        return jsonify({"error": str(e)}), 500
+        yield _sse({"error": str(e)})
+
+# --- API Endpoint ---
+@app.route("/chat", methods=["POST"])
+def chat_endpoint():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object."}), 400
+    user_input = data.get("message", "")
+
+    events = _iterate_async(_chat_events(user_input))
+    return Response(stream_with_context(events), mimetype="text/event-stream")
 
 if __name__ == "__main__":
     # Create the chatbot workspace directory if it doesn't exist
@@ -1,17 +1,42 @@
+import asyncio
 import os
 from typing import Dict, List, Optional
-from dataclasses import dataclass
-import json
+from dataclasses import dataclass, replace
+import orjson
 import vertexai
 import datetime
+import functools
+import hashlib
+import io
+import re
+import sqlite3
+import weakref
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
 
 from vertexai.generative_models import (
+    FinishReason,
     Part,
 )
 from vertexai.preview import caching
 from vertexai.preview.generative_models import GenerativeModel
 from vertexai.preview.tokenization import get_tokenizer_for_model
 
+SOURCE_SUFFIXES = (".py", ".js", ".cpp")
+PROGRESS_FILENAME = "analysis_progress.json"
+# Bump when the analysis prompt changes so cached issues are not reused
+ISSUE_PROMPT_VERSION = "2"
+# Matches the header that starts the response section for each chunk of a batch
+_CHUNK_HEADER_RE = re.compile(r"^\s*===\s*CHUNK\s+(\d+)\s*===\s*$", re.MULTILINE)
+# Matches one "Issue: / Fix Suggestion: / Priority:" block of the analysis response.
+# Each field is a single line, so a match never runs into the next "---" block.
+_ISSUE_RE = re.compile(
+    r"Issue:[ \t]*(?P<description>[^\n]+)"
+    r"(?:\s*Fix Suggestion:[ \t]*(?P<fix>[^\n]*))?"
+    r"(?:\s*Priority:[ \t]*(?P<priority>[^\n]*))?"
+)
+ANALYSIS_SYSTEM_INSTRUCTION = "Analyze the following code for issues and suggest fixes."
+
 @dataclass
 class CodeChunk:
     file_path: str
@@ -26,58 +51,181 @@ class Issue:
     fix_suggestion: Optional[str] = None
     priority: int = 0
 
+@functools.lru_cache(maxsize=None)
+def _init_vertexai(project: Optional[str], location: Optional[str]):
+    """Initializes Vertex AI once per project/location so analyzers share its clients."""
+    vertexai.init(project=project, location=location)
+
+@functools.lru_cache(maxsize=None)
+def _get_tokenizer(model_name: str):
+    """Loads the local tokenizer once per model instead of once per analyzer."""
+    return get_tokenizer_for_model(model_name)
+
+def _atomic_write_json(path: str, data):
+    """Writes data as JSON to a temporary file and swaps it in, so a crash never leaves a truncated file."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(orjson.dumps(data))
+    os.replace(tmp_path, path)
+
+def _scan_source_files(base_path: str):
+    """Yields source files under base_path, using the cached directory entry types from os.scandir."""
+    stack = [base_path]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.endswith(SOURCE_SUFFIXES) and entry.is_file():
+                        yield entry.path
+        except OSError as e:
+            print(f"Skipping directory {directory}: {e}")
+
+def _read_source_file(file_path: str) -> Optional[str]:
+    """Reads a source file, returning None if it is not valid text."""
+    try:
+        with open(file_path, "r") as f:
+            return f.read()
+    except UnicodeDecodeError:
+        print(f"Skipping file {file_path} due to UnicodeDecodeError")
+        return None
+
+def _parse_issues(chunk: CodeChunk, text: str) -> List[Issue]:
+    """Extracts the issues from the model's response for one chunk."""
+    issues = []
+    if "No issues found" in text:
+        return issues
+
+    for match in _ISSUE_RE.finditer(text):
+        fix_suggestion = (match["fix"] or "").strip()
+        try:
+            priority = int((match["priority"] or "0").strip())
+        except ValueError as e:
+            print(f"Error parsing issue: {e}")
+            continue
+        issues.append(
+            Issue(
+                chunk,
+                match["description"].strip(),
+                None if fix_suggestion in ("", "None") else fix_suggestion,
+                priority,
+            )
+        )
+    return issues
+
 class CodebaseAnalyzer:
-    def __init__(self, base_path: str, chunk_size: int = 1000, ttl: int = 60, min_token_count: int = 32768):
+    def __init__(self, base_path: str, chunk_size: int = 1000, ttl: int = 60, min_token_count: int = 32768, max_concurrency: int = 8,
+                 chunks_per_prompt: int = 8):
         self.base_path = base_path
         self.chunk_size = chunk_size
-        self.issues_db = {}
-        self.progress_file = os.path.join(base_path, "analysis_progress.json")
+        self.max_concurrency = max_concurrency
+        self.chunks_per_prompt = chunks_per_prompt
+        self.progress_file = os.path.join(base_path, PROGRESS_FILENAME)
         self.cache_mapping_file = os.path.join(base_path, "cache_mapping.json")
         self.cache_mapping = self.load_cache_mapping()
+        self.issue_cache_file = os.path.join(base_path, "issue_cache.sqlite")
+        self._issue_cache: Dict[str, List[Dict]] = {}
+        self._issue_cache_ready = False
         self.ttl = ttl
         self.PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT")
         self.LOCATION = os.getenv("REGION")
         self.min_token_count = min_token_count
-        vertexai.init(project=self.PROJECT_ID, location=self.LOCATION)
+        _init_vertexai(self.PROJECT_ID, self.LOCATION)
         self.model_name = "gemini-1.5-pro-002" # Specify the model you'll be using
-        self.tokenizer = get_tokenizer_for_model(self.model_name)
+        self.tokenizer = _get_tokenizer(self.model_name)
+        self._loop_models: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Optional[str], GenerativeModel]]" = (
+            weakref.WeakKeyDictionary()
+        )
 
 
     def load_progress(self) -> Dict:
         if os.path.exists(self.progress_file):
-            with open(self.progress_file, 'r') as f:
-                return json.load(f)
+            with open(self.progress_file, 'rb') as f:
+                return orjson.loads(f.read())
         return {'processed_files': [], 'current_file': None, 'current_position': 0}
 
     def save_progress(self, progress: Dict):
-        with open(self.progress_file, 'w') as f:
-            json.dump(progress, f)
+        _atomic_write_json(self.progress_file, progress)
 
     def load_cache_mapping(self) -> Dict:
         if os.path.exists(self.cache_mapping_file):
-            with open(self.cache_mapping_file, 'r') as f:
-                return json.load(f)
+            with open(self.cache_mapping_file, 'rb') as f:
+                return orjson.loads(f.read())
         return {}
 
     def save_cache_mapping(self):
-        with open(self.cache_mapping_file, 'w') as f:
-            json.dump(self.cache_mapping, f)
-
-    def get_file_chunks(self, file_path: str) -> List[CodeChunk]:
+        _atomic_write_json(self.cache_mapping_file, self.cache_mapping)
+
+    def issue_cache_key(self, chunk: CodeChunk, issue_query: Optional[str] = None) -> str:
+        """Hashes everything that determines the issues found in a chunk, apart from its location."""
+        digest = hashlib.blake2b(digest_size=20)
+        for value in (ISSUE_PROMPT_VERSION, issue_query or "", chunk.content):
+            digest.update(value.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _connect_issue_cache(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.issue_cache_file)
+        if not self._issue_cache_ready:
+            conn.execute("CREATE TABLE IF NOT EXISTS issues (key TEXT PRIMARY KEY, json TEXT)")
+            self._issue_cache_ready = True
+        return conn
+
+    def load_cached_issues(self, keys: List[str]) -> Dict[str, List[Dict]]:
+        """Returns previously found issues for each of the cache keys that was analyzed before."""
+        found = {key: self._issue_cache[key] for key in keys if key in self._issue_cache}
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        if not missing:
+            return found
+
+        with closing(self._connect_issue_cache()) as conn:
+            # Stay below SQLite's limit on the number of query parameters
+            for i in range(0, len(missing), 500):
+                batch = missing[i:i + 500]
+                placeholders = ", ".join("?" * len(batch))
+                for key, issues_json in conn.execute(f"SELECT key, json FROM issues WHERE key IN ({placeholders})", batch):
+                    found[key] = self._issue_cache[key] = orjson.loads(issues_json)
+        return found
+
+    def save_cached_issues(self, issues_by_key: Dict[str, List[Issue]]):
+        """Stores the issues found for several cache keys in a single transaction."""
+        rows = []
+        for key, issues in issues_by_key.items():
+            issues_data = [
+                {"description": issue.description, "fix_suggestion": issue.fix_suggestion, "priority": issue.priority}
+                for issue in issues
+            ]
+            self._issue_cache[key] = issues_data
+            rows.append((key, orjson.dumps(issues_data).decode()))
+        if not rows:
+            return
+
+        with closing(self._connect_issue_cache()) as conn, conn:
+            conn.executemany("INSERT OR REPLACE INTO issues (key, json) VALUES (?, ?)", rows)
+
+    def get_file_chunks(self, file_path: str, content: Optional[str] = None) -> List[CodeChunk]:
         chunks = []
-        try:
-            with open(file_path, 'r') as f:
-                lines = f.readlines()
-        except UnicodeDecodeError:
-            print(f"Skipping file {file_path} due to UnicodeDecodeError")
-            return []
+        if content is not None:
+            # Reuse content that has already been read, split the same way as readlines()
+            lines = io.StringIO(content).readlines()
+        else:
+            try:
+                with open(file_path, 'r') as f:
+                    lines = f.readlines()
+            except UnicodeDecodeError:
+                print(f"Skipping file {file_path} due to UnicodeDecodeError")
+                return []
 
         current_chunk = []
+        current_length = 0
         current_start = 0
 
         for i, line in enumerate(lines):
             current_chunk.append(line)
-            if len(''.join(current_chunk)) >= self.chunk_size:
+            current_length += len(line)
+            if current_length >= self.chunk_size:
                 chunks.append(CodeChunk(
                     file_path=file_path,
                     start_line=current_start,
@@ -85,6 +233,7 @@ class CodebaseAnalyzer:
                     content=''.join(current_chunk)
                 ))
                 current_chunk = []
+                current_length = 0
                 current_start = i + 1
 
         if current_chunk:
@@ -123,36 +272,57 @@ class CodebaseAnalyzer:
 
         return last_modified_time <= cache_creation_timestamp
 
-    def analyze_chunk(self, chunk: CodeChunk, model, issue_query: Optional[str] = None) -> List[Issue]:
-        # Retrieve CachedContent
-        cached_content_name = self.cache_mapping.get("codebase_cache_name")
-        print(f"Issue query in analyze_chunk: {issue_query}")
+    def _get_loop_model(self, cached_content_name: Optional[str]) -> GenerativeModel:
+        """Returns the model for a cache, or the base model for None, built once per event loop.
 
-        if cached_content_name:
-            # Use cached model
-            cached_content = caching.CachedContent(cached_content_name=cached_content_name)
-            cached_model = GenerativeModel.from_cached_content(
-                cached_content=cached_content
-            )
-        else:
-            # Fallback to the original model if no cache exists
-            cached_model = model
+        The model's async client is bound to the event loop it was first used on, and
+        each analysis run gets its own loop from asyncio.run.
+        """
+        models = self._loop_models.setdefault(asyncio.get_running_loop(), {})
+        if cached_content_name not in models:
+            if cached_content_name:
+                cached_content = caching.CachedContent(cached_content_name=cached_content_name)
+                models[cached_content_name] = GenerativeModel.from_cached_content(
+                    cached_content=cached_content
+                )
+            else:
+                models[None] = GenerativeModel(self.model_name, system_instruction=ANALYSIS_SYSTEM_INSTRUCTION)
+        return models[cached_content_name]
+
+    def get_cached_model(self) -> Optional[GenerativeModel]:
+        """Returns a model backed by the codebase cache, or None if there is no cache."""
+        cached_content_name = self.cache_mapping.get("codebase_cache_name")
+        if not cached_content_name:
+            return None
+        return self._get_loop_model(cached_content_name)
+
+    async def analyze_chunk(self, chunk: CodeChunk, model, issue_query: Optional[str] = None) -> List[Issue]:
+        return (await self.analyze_chunks([chunk], model, issue_query=issue_query))[0]
+
+    async def analyze_chunk_batch(self, chunks: List[CodeChunk], model, issue_query: Optional[str] = None) -> List[List[Issue]]:
+        """Analyzes several chunks with a single prompt, returning the issues found in each."""
+        print(f"Issue query in analyze_chunk_batch: {issue_query}")
+
+        # Use cached model
+        cached_model = self.get_cached_model()
+        if cached_model is None:
+            # Fallback to the original model if no cache exists. A chat session
+            # cannot run one-off prompts, so use the analyzer's own model instead.
+            cached_model = model if hasattr(model, "generate_content_async") else self._get_loop_model(None)
             print(
                 f"Warning: No cache found. Using the original model for analysis."
             )
 
         # Construct prompt for the LLM
-        # Filter out padding content before sending to the model
-        chunk_content = chunk.content
-        if "--- PADDING START ---" in chunk.content and "--- PADDING END ---" in chunk.content:
-            chunk_content = chunk_content.split("--- PADDING START ---")[0] + chunk_content.split("--- PADDING END ---")[1]
-
-        prompt = f"""Analyze the following code chunk for issues:
+        prompt = "Analyze the following code chunks for issues:\n"
+        for number, chunk in enumerate(chunks, 1):
+            prompt += f"""
+        ===CHUNK {number}===
         File: {chunk.file_path}
         Lines: {chunk.start_line}-{chunk.end_line}
 
         ```
-        {chunk_content}
+        {chunk.content}
         ```
         """
 
@@ -161,103 +331,92 @@ class CodebaseAnalyzer:
             prompt += f"\nSpecifically with respect to: {issue_query}\n"
 
         prompt += """
-        Identify any issues and suggest fixes. Return the response in the format:
+        For each chunk, start with its ===CHUNK <number>=== header line, then
+        identify any issues and suggest fixes. Return the response in the format:
+        ===CHUNK <number>===
         Issue: <Description of the issue>
         Fix Suggestion: <Suggested fix, or None if no fix is suggested>
         Priority: <Priority of the issue, integer>
         ---
-        If no issue found then return:
+        If no issue found in a chunk then return under its header:
         No issues found
         """
 
         # Get LLM response using the appropriate model
         try:
-            response = cached_model.generate_content(prompt)
+            response = await cached_model.generate_content_async(prompt)
             print(f"Response text: {response.text}")
         except Exception as e:
             print(f"Error during content generation: {e}")
-            return []
+            return [[] for _ in chunks]
 
-        issues = []
+        results: List[List[Issue]] = [[] for _ in chunks]
+        issues_by_key: Dict[str, List[Issue]] = {}
         # Parse response only if the response object has candidates
         if response.candidates:
-            # Assuming 'text' is an attribute of the response object
-            text = response.text
-            if "No issues found" not in text:
-                # Parse response and extract issues
-                for issue_text in text.split("---"):
-                    issue_text = issue_text.strip()
-                    if issue_text:
-                        try:
-                            issue_parts = issue_text.split("\n")
-                            description = issue_parts[0].split(":", 1)[1].strip()
-                            fix_suggestion = None
-                            priority = 0
-                            for part in issue_parts[1:]:
-                                if part.startswith("Fix Suggestion:"):
-                                    fix_suggestion = part.split(":", 1)[1].strip()
-                                    if fix_suggestion == "None":
-                                        fix_suggestion = None
-                                elif part.startswith("Priority:"):
-                                    priority = int(part.split(":", 1)[1].strip())
-                            issues.append(
-                                Issue(chunk, description, fix_suggestion, priority)
-                            )
-                        except Exception as e:
-                            print(f"Error parsing issue: {e}")
-
-        return issues
-
-    def process_codebase(self, model, issue_query: Optional[str] = None):
+            # Split the response into the sections for each chunk
+            sections = _CHUNK_HEADER_RE.split(response.text)
+            section_texts = list(zip(sections[1::2], sections[2::2]))
+            if not section_texts and len(chunks) == 1:
+                # The model often leaves out the header when there is only one chunk
+                section_texts = [("1", response.text)]
+
+            # A truncated response may end partway through a section, so only cache complete ones
+            finished = response.candidates[0].finish_reason == FinishReason.STOP
+            for number, text in section_texts:
+                index = int(number) - 1
+                if not 0 <= index < len(chunks):
+                    continue
+                chunk = chunks[index]
+                issues = _parse_issues(chunk, text)
+                results[index] = issues
+                if finished and (issues or "No issues found" in text):
+                    issues_by_key[self.issue_cache_key(chunk, issue_query)] = issues
+
+        # Keep the SQLite commit off the event loop so it does not stall other requests
+        await asyncio.to_thread(self.save_cached_issues, issues_by_key)
+        return results
+
+    def process_codebase(self, model, issue_query: Optional[str] = None) -> Dict[str, List[Dict]]:
+        """Analyzes the unprocessed files of the codebase, returning the issues found per file."""
         print(f'Issue query in process_codebase: {issue_query}')
         progress = self.load_progress()
-        self.issues_db = {}  # Reset issues_db
 
         # Aggregate content for all files recursively
         codebase_content_parts = []
         codebase_files = []  # Keep track of files added to the cache
-
-        def process_directory(directory):
-            nonlocal codebase_content_parts, codebase_files
-            for root, _, files in os.walk(directory):
-                for file in files:
-                    if file.endswith((".py", ".js", ".cpp")):
-                        file_path = os.path.join(root, file)
-                        if file_path not in progress["processed_files"]:
-                            try:
-                                with open(file_path, "r") as f:
-                                    file_content = f.read()
-                                codebase_content_parts.append(Part.from_text(file_content))
-                                codebase_files.append(file_path)  # Add file to the list
-                            except UnicodeDecodeError:
-                                print(f"Skipping file {file_path} due to UnicodeDecodeError")
-
-        process_directory(self.base_path)  # Start recursive processing from the base path
-
-        # --- Padding Logic with Accurate Token Counting ---
-        if codebase_content_parts:
-            total_tokens = 0
-            for part in codebase_content_parts:
-                # Ensure that we are passing a string to the tokenizer
-                response = self.tokenizer.count_tokens(part.text)
-                total_tokens += response.total_tokens
-
-            if total_tokens < self.min_token_count:
-                padding_tokens_needed = self.min_token_count - total_tokens
-                # Create padding content
-                padding_content = "This is padding content to meet the minimum token requirement for caching. " * (padding_tokens_needed // 10 + 1)
-                padding_content = f"--- PADDING START ---\n{padding_content}\n--- PADDING END ---"
-                
-                # Ensure that padding content itself is treated as a single part
-                padding_part = Part.from_text(padding_content)
-                codebase_content_parts.append(padding_part)
-                print(f"Added padding of {self.tokenizer.count_tokens(padding_part.text).total_tokens} tokens.")
+        codebase_texts: Dict[str, str] = {}  # File contents, reused for chunking
+        total_tokens = 0
+
+        # Find unprocessed source files and read them concurrently
+        processed_files = set(progress["processed_files"])
+        file_paths = [path for path in _scan_source_files(self.base_path) if path not in processed_files]
+        with ThreadPoolExecutor() as executor:
+            for file_path, file_content in zip(file_paths, executor.map(_read_source_file, file_paths)):
+                if file_content is None:
+                    continue
+                codebase_content_parts.append(Part.from_text(file_content))
+                codebase_files.append(file_path)  # Add file to the list
+                codebase_texts[file_path] = file_content
+                # Only count tokens until we know the codebase is large enough to cache
+                if total_tokens < self.min_token_count:
+                    total_tokens += self.tokenizer.count_tokens(file_content).total_tokens
 
         # Create CachedContent for the entire codebase if not exists or if cache is invalid
-        if codebase_content_parts and ("codebase_cache_name" not in self.cache_mapping or not self.is_cache_valid(codebase_files[0])):
+        needs_cache = bool(codebase_content_parts) and (
+            "codebase_cache_name" not in self.cache_mapping or not self.is_cache_valid(codebase_files[0])
+        )
+        if needs_cache and total_tokens < self.min_token_count:
+            # Too small for context caching, analyze with the base model instead of padding the cache
+            print(f"Codebase has {total_tokens} tokens, below the {self.min_token_count} needed for caching.")
+            needs_cache = False
+            if self.cache_mapping.pop("codebase_cache_name", None):
+                self.save_cache_mapping()
+
+        if needs_cache:
             cached_content = caching.CachedContent.create(
                 model_name=self.model_name,
-                system_instruction="Analyze the following code for issues and suggest fixes.",
+                system_instruction=ANALYSIS_SYSTEM_INSTRUCTION,
                 contents=codebase_content_parts,
                 ttl=datetime.timedelta(minutes=self.ttl),
                 display_name=f"cache_for_codebase_{self.base_path.replace('/', '_')}",
@@ -265,21 +424,82 @@ class CodebaseAnalyzer:
             self.cache_mapping["codebase_cache_name"] = cached_content.name
             self.save_cache_mapping()
 
-        # Analyze each file using the cached content
-        for file_path in codebase_files:
-            chunks = self.get_file_chunks(file_path)
-            for chunk in chunks:
-                # Pass the issue_query down to analyze_chunk
-                issues = self.analyze_chunk(chunk, model, issue_query=issue_query)
-                if issues:
-                    for issue in issues:
-                        self.issues_db.setdefault(file_path, []).append(
-                            {
-                                "issue": issue,
-                                "cached_content_name": self.cache_mapping.get("codebase_cache_name"),
-                            }
-                        )
-            print(issues)
-
-            progress["processed_files"].append(file_path)
+        # Analyze the files using the cached content
+        file_chunks = {
+            file_path: self.get_file_chunks(file_path, content=content)
+            for file_path, content in codebase_texts.items()
+        }
+        return asyncio.run(self.analyze_files(file_chunks, model, progress, issue_query=issue_query))
+
+    async def analyze_chunks(self, chunks: List[CodeChunk], model, issue_query: Optional[str] = None) -> List[List[Issue]]:
+        """Analyzes chunks in batches of chunks_per_prompt, with at most max_concurrency requests in flight."""
+        results: List[Optional[List[Issue]]] = [None] * len(chunks)
+
+        # Identical chunks (vendored files, boilerplate) only need to be analyzed once
+        cache_keys = [self.issue_cache_key(chunk, issue_query) for chunk in chunks]
+        cached = await asyncio.to_thread(self.load_cached_issues, cache_keys)
+        pending: Dict[str, List[int]] = {}
+        for index, (chunk, cache_key) in enumerate(zip(chunks, cache_keys)):
+            if cache_key in cached:
+                results[index] = [Issue(chunk, **issue_data) for issue_data in cached[cache_key]]
+            else:
+                pending.setdefault(cache_key, []).append(index)
+
+        unique = [indices[0] for indices in pending.values()]
+        batches = [unique[i:i + self.chunks_per_prompt] for i in range(0, len(unique), self.chunks_per_prompt)]
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def analyze(batch: List[int]) -> List[List[Issue]]:
+            async with semaphore:
+                return await self.analyze_chunk_batch([chunks[i] for i in batch], model, issue_query=issue_query)
+
+        batch_results = await asyncio.gather(*(analyze(batch) for batch in batches))
+        for batch, issues_per_chunk in zip(batches, batch_results):
+            for index, issues in zip(batch, issues_per_chunk):
+                results[index] = issues
+
+        # Copy the issues over to the duplicates of each analyzed chunk
+        for indices in pending.values():
+            for index in indices[1:]:
+                results[index] = [replace(issue, chunk=chunks[index]) for issue in results[indices[0]]]
+
+        return results
+
+    async def analyze_files(self, file_chunks: Dict[str, List[CodeChunk]], model, progress: Dict,
+                            issue_query: Optional[str] = None) -> Dict[str, List[Dict]]:
+        """Analyzes files in groups, saving progress after each group completes.
+
+        Groups are sized by chunk count, so each one fills max_concurrency prompts
+        of chunks_per_prompt chunks no matter how small the files are.
+        """
+        issues_db: Dict[str, List[Dict]] = {}
+        group_size = self.max_concurrency * self.chunks_per_prompt
+        groups: List[List[str]] = [[]]
+        group_chunks = 0
+        for file_path, chunks in file_chunks.items():
+            if group_chunks >= group_size:
+                groups.append([])
+                group_chunks = 0
+            groups[-1].append(file_path)
+            group_chunks += len(chunks)
+
+        for batch in groups:
+            if not batch:
+                continue
+            chunks = [chunk for file_path in batch for chunk in file_chunks[file_path]]
+            # Pass the issue_query down to analyze_chunk
+            results = await self.analyze_chunks(chunks, model, issue_query=issue_query)
+
+            for chunk, issues in zip(chunks, results):
+                for issue in issues:
+                    issues_db.setdefault(chunk.file_path, []).append(
+                        {
+                            "issue": issue,
+                            "cached_content_name": self.cache_mapping.get("codebase_cache_name"),
+                        }
+                    )
+
+            progress["processed_files"].extend(batch)
             self.save_progress(progress)
+
+        return issues_db
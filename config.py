@@ -0,0 +1,56 @@
+import functools
+import json
+import os
+import re
+import yaml
+
+# --- Command Whitelist ---
+COMMANDS_FILE = "commands.yaml"
+COMMANDS_CACHE_FILE = COMMANDS_FILE + ".json"
+
+@functools.lru_cache(maxsize=1)
+def load_commands():
+    """Loads the command whitelist, using a JSON sidecar while commands.yaml is unchanged."""
+    try:
+        if os.path.getmtime(COMMANDS_FILE) <= os.path.getmtime(COMMANDS_CACHE_FILE):
+            with open(COMMANDS_CACHE_FILE, "r") as f:
+                return json.load(f)
+    except (OSError, ValueError):
+        # Missing or unreadable sidecar, fall back to parsing the YAML
+        pass
+
+    with open(COMMANDS_FILE, "r") as f:
+        commands = yaml.safe_load(f)
+
+    try:
+        tmp_file = COMMANDS_CACHE_FILE + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(commands, f)
+        os.replace(tmp_file, COMMANDS_CACHE_FILE)
+    except OSError as e:
+        print(f"Could not write commands cache: {e}")
+
+    return commands
+
+# Load command whitelist from commands.yaml
+COMMAND_WHITELIST = load_commands()
+
+def _compile_validators(commands):
+    """Compiles the validation rule of each Linux command parameter once.
+
+    Python function entries are never validated, so only command entries need rules.
+    """
+    validators = {}
+    for intent, details in commands["commands"].items():
+        # execute_command runs Python function entries before it validates anything
+        if "function" in details or "command" not in details:
+            continue
+        for param_data in details.get("parameters", []):
+            if "validation" not in param_data:
+                raise ValueError(
+                    f"Parameter '{param_data['name']}' of command '{intent}' in {COMMANDS_FILE} has no validation rule"
+                )
+            validators[(intent, param_data["name"])] = re.compile(param_data["validation"])
+    return validators
+
+PARAMETER_VALIDATORS = _compile_validators(COMMAND_WHITELIST)
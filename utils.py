@@ -1,12 +1,16 @@
+import asyncio
+import threading
+from collections import OrderedDict
 import subprocess
 import re
 import os
 import shlex
-from codeanalysis import CodebaseAnalyzer, Issue
+from codeanalysis import PROGRESS_FILENAME, CodebaseAnalyzer, Issue
+from config import COMMAND_WHITELIST, PARAMETER_VALIDATORS
 
-def validate_parameter(parameter_name, value, validation_rule):
-    """Validates a parameter value against a given rule."""
-    if not re.match(validation_rule, value):
+def validate_parameter(parameter_name, value, validation_pattern):
+    """Validates a parameter value against a compiled validation pattern."""
+    if not validation_pattern.match(value):
         raise ValueError(f"Invalid value for parameter '{parameter_name}': {value}")
 
 def create_file(parameters):
@@ -21,6 +25,31 @@ def create_file(parameters):
     except Exception as e:
         raise RuntimeError(f"Error creating file: {e}")
 
+# (progress file mtime, analyzer) by base_path, most recently used last
+_analyzers = OrderedDict()
+_analyzers_lock = threading.Lock()
+_MAX_ANALYZERS = 32
+
+def _get_analyzer(base_path):
+    """Reuses the analyzer for a codebase until its progress file changes."""
+    progress_mtime = _progress_mtime(base_path)
+    with _analyzers_lock:
+        cached = _analyzers.get(base_path)
+        if cached is None or cached[0] != progress_mtime:
+            # Replaces any analyzer superseded by a newer progress file
+            cached = _analyzers[base_path] = (progress_mtime, CodebaseAnalyzer(base_path))
+        _analyzers.move_to_end(base_path)
+        if len(_analyzers) > _MAX_ANALYZERS:
+            _analyzers.popitem(last=False)
+        return cached[1]
+
+def _progress_mtime(base_path):
+    """Returns the modification time of the codebase's progress file, or None if there is none."""
+    try:
+        return os.path.getmtime(os.path.join(base_path, PROGRESS_FILENAME))
+    except OSError:
+        return None
+
 def analyze_codebase(parameters, model):  # Add model as a parameter
     """Analyzes a codebase for issues using CodebaseAnalyzer.
     Optionally analyzes a single file if filename is provided.
@@ -29,17 +58,18 @@ def analyze_codebase(parameters, model):  # Add model as a parameter
     filename = parameters.get("filename")
     issue_query = parameters.get("issue")
 
-    analyzer = CodebaseAnalyzer(base_path)
+    analyzer = _get_analyzer(base_path)
 
     if filename:
         # Analyze a specific file
+        issues_db = {}
         file_path = os.path.join(base_path, filename)
         if os.path.exists(file_path):
             chunks = analyzer.get_file_chunks(file_path)
-            for chunk in chunks:
-                issues = analyzer.analyze_chunk(chunk, model=model, issue_query=issue_query)  # Pass issue_query
+            results = asyncio.run(analyzer.analyze_chunks(chunks, model=model, issue_query=issue_query))  # Pass issue_query
+            for issues in results:
                 if issues:
-                    analyzer.issues_db.setdefault(file_path, []).extend([
+                    issues_db.setdefault(file_path, []).extend([
                         {"issue": issue, "cached_content_name": analyzer.cache_mapping.get(file_path)}
                         for issue in issues
                     ])
@@ -47,10 +77,10 @@ def analyze_codebase(parameters, model):  # Add model as a parameter
             return f"File not found: {file_path}"
     else:
         # Analyze all files in the base_path
-        analyzer.process_codebase(model=model, issue_query=issue_query)  # Pass issue_query
+        issues_db = analyzer.process_codebase(model=model, issue_query=issue_query)  # Pass issue_query
 
     response_parts = []
-    for file_path, issues_data in analyzer.issues_db.items():
+    for file_path, issues_data in issues_db.items():
         response_parts.append(f"Issues in {file_path}:")
         for issue_data in issues_data:
             issue = issue_data["issue"]
@@ -61,17 +91,23 @@ def analyze_codebase(parameters, model):  # Add model as a parameter
 
     return "\n".join(response_parts) if response_parts else "No issues found."
 
-def read_file(parameters):
-    """Reads the content of a file."""
+def iter_read_file(parameters, block_size=65536):
+    """Yields the content of a file in blocks, wrapped the same way as read_file."""
     filename = parameters["filename"]
     filepath = os.path.join(os.path.expanduser("~/chatbot_workspace"), filename)
     try:
         with open(filepath, "r") as f:
-            content = f.read()
-        return f"Content of {filename}:\n```\n{content}\n```"
+            yield f"Content of {filename}:\n```\n"
+            while block := f.read(block_size):
+                yield block
+            yield "\n```"
     except Exception as e:
         raise RuntimeError(f"Error reading file: {e}")
 
+def read_file(parameters):
+    """Reads the content of a file."""
+    return "".join(iter_read_file(parameters))
+
 def append_to_file(parameters):
     """Appends the given content to a file."""
     filename = parameters["filename"]
@@ -96,18 +132,20 @@ def overwrite_file(parameters):
     except Exception as e:
         raise RuntimeError(f"Error overwriting to file: {e}")
 
+# Escape sequences the model emits in file content
+_ESCAPES = {"\\n": "\n", "\\t": "\t", "\\r": "\r", "\\\\": "\\"}
+_ESCAPE_RE = re.compile(r"\\[ntr\\]")
+
 def unescape_string(content):
     """
     Unescapes special characters in the content.
     """
-    return content.encode().decode('unicode_escape')
+    return _ESCAPE_RE.sub(lambda m: _ESCAPES[m.group()], content)
 
 def execute_command(intent, parameters):
     """
     Executes a command based on the intent and parameters.
     """
-    from app import COMMAND_WHITELIST
-
     if intent not in COMMAND_WHITELIST["commands"]:
         raise ValueError(f"Invalid intent: {intent}")
 
@@ -134,7 +172,7 @@ def execute_command(intent, parameters):
         if param_name not in parameters:
             raise ValueError(f"Missing parameter: {param_name}")
         param_value = parameters[param_name]
-        validate_parameter(param_name, param_value, param_data["validation"])
+        validate_parameter(param_name, param_value, PARAMETER_VALIDATORS[(intent, param_name)])
 
         command_args.append(param_value)
     